@@ -20,7 +20,7 @@ This script performs the following steps:
 5. Creates a summary materialized view on top of the metadata table.
 6. Configures streaming from the DICOM store to the partitioned table.
 
-Usage: python export_dicom_metadata_to_bq.py <dicom_store_path> <dataset_id>
+Usage: python export_dicom_metadata_to_bq.py <dicom_store_path> <dataset_id> [--poll_timeout SECONDS]
 
 Example:
 python export_dicom_metadata_to_bq.py \
@@ -29,18 +29,46 @@ python export_dicom_metadata_to_bq.py \
 """
 
 import argparse
+import random
 import time
 
 from google.api_core.exceptions import NotFound
 from google.cloud import bigquery
 from googleapiclient import discovery
 
-def export_dicom_metadata_to_bq(dicom_store_path: str, dataset_id: str) -> None:
+POLL_INITIAL_DELAY = 5.0     # Initial delay between operation polls (seconds)
+POLL_DELAY_MULTIPLIER = 1.5  # Delay multiplier applied after each poll
+POLL_MAX_DELAY = 45.0        # Maximum delay between operation polls (seconds)
+POLL_TIMEOUT = 12 * 60 * 60  # Default total time to wait for the export operation (seconds)
+EXPORT_ATTEMPTS = 5          # Export attempts when the operation fails with a transient error
+TRANSIENT_ERROR_CODES = {8, 14}  # RESOURCE_EXHAUSTED, UNAVAILABLE
+INSERT_CHUNK_SIZE = 500      # Rows per streaming insert request (BigQuery recommendation)
+INSERT_MAX_CHUNK_SIZE = 50000  # Maximum rows per streaming insert request (BigQuery limit)
+
+def insert_rows_chunked(bq_client, table, rows: list, chunk_size: int = INSERT_CHUNK_SIZE) -> None:
+    """Streams rows to a BigQuery table in chunks of at most chunk_size rows per request.
+
+    Args:
+        bq_client: The BigQuery client.
+        table: The destination table (Table, TableReference or table ID).
+        rows: The rows to insert, as JSON-compatible dicts.
+        chunk_size: Number of rows per insert request.
+    """
+    if not 0 < chunk_size <= INSERT_MAX_CHUNK_SIZE:
+        raise ValueError(f"chunk_size must be between 1 and {INSERT_MAX_CHUNK_SIZE}")
+
+    for i in range(0, len(rows), chunk_size):
+        errors = bq_client.insert_rows_json(table, rows[i:i + chunk_size])
+        if errors:
+            raise Exception(f"Streaming insert failed for rows {i} to {min(i + chunk_size, len(rows)) - 1}: {errors}")
+
+def export_dicom_metadata_to_bq(dicom_store_path: str, dataset_id: str, poll_timeout: int = POLL_TIMEOUT) -> None:
     """Exports DICOM metadata to BigQuery and configures streaming.
 
     Args:
         dicom_store_path: Path to the DICOM store.
         dataset_id: ID of the BigQuery dataset.
+        poll_timeout: Total time to wait for the export operation (seconds).
     """
 
     # Create API clients
@@ -69,26 +97,41 @@ def export_dicom_metadata_to_bq(dicom_store_path: str, dataset_id: str) -> None:
         table_ref_temp = bq_client.dataset(dataset_id).table(table_id_temp)
         print(f"Exporting metadata to temporary table: {table_ref_temp}")
 
-        response = dicom_client.projects().locations().datasets().dicomStores().export(
-            name=dicom_store_path,
-            body={
-                "bigqueryDestination": {
-                    "tableUri": f"bq://{table_ref_temp}",
-                    "writeDisposition": "WRITE_TRUNCATE"
+        for attempt in range(EXPORT_ATTEMPTS):
+            response = dicom_client.projects().locations().datasets().dicomStores().export(
+                name=dicom_store_path,
+                body={
+                    "bigqueryDestination": {
+                        "tableUri": f"bq://{table_ref_temp}",
+                        "writeDisposition": "WRITE_TRUNCATE"
+                    }
                 }
-            }
-        ).execute()
-
-        # Wait for the export operation to complete
-        while True:
-            operation = dicom_client.projects().locations().datasets().operations().get(
-                name=response['name']
             ).execute()
-            if 'done' in operation and operation['done']:
-                if 'error' in operation:
-                    raise Exception(f"Export operation failed: {operation['error']}")
+
+            # Wait for the export operation to complete (exponential backoff)
+            delay = POLL_INITIAL_DELAY
+            deadline = time.time() + poll_timeout
+            while True:
+                operation = dicom_client.projects().locations().datasets().operations().get(
+                    name=response['name']
+                ).execute()
+                if 'done' in operation and operation['done']:
+                    break
+                if time.time() > deadline:
+                    raise TimeoutError(f"Export operation {response['name']} did not complete in {poll_timeout} seconds")
+                time.sleep(delay)
+                delay = min(delay * POLL_DELAY_MULTIPLIER, POLL_MAX_DELAY)
+
+            if 'error' not in operation:
                 break
-            time.sleep(5)
+
+            # Retry transient errors with exponential backoff and full jitter
+            if operation['error'].get('code') in TRANSIENT_ERROR_CODES and attempt + 1 < EXPORT_ATTEMPTS:
+                wait_time = random.uniform(0, min(600, 30 * (2 ** attempt)))
+                print(f"Export operation failed with transient error: {operation['error']}. Retrying in {wait_time:.0f} seconds...")
+                time.sleep(wait_time)
+            else:
+                raise Exception(f"Export operation failed: {operation['error']}")
 
         print(f"Metadata exported to temporary table: {table_ref_temp}")
 
@@ -106,6 +149,7 @@ def export_dicom_metadata_to_bq(dicom_store_path: str, dataset_id: str) -> None:
         bq_client.create_table(table, True)
 
         # Copy data from temporary table to partitioned table
+        # (a query job, since copy jobs can't write an unpartitioned table into a partitioned one)
         job_config = bigquery.QueryJobConfig(
             destination=table_ref, write_disposition="WRITE_TRUNCATE"
         )
@@ -183,6 +227,8 @@ def export_dicom_metadata_to_bq(dicom_store_path: str, dataset_id: str) -> None:
         print(f"Materialized view created: {view_ref}")
 
         # 6. Configure streaming
+        # Note: ingestion into BigQuery is managed by the Healthcare API; the DICOM
+        # streamConfigs destination has no option to select the Storage Write API.
         print(f"Configuring streaming to: {table_ref}")
 
         dicom_store['streamConfigs'] = [{
@@ -210,7 +256,9 @@ if __name__ == "__main__":
     )
     parser.add_argument("dicom_store_path", help="Path to the DICOM store.")
     parser.add_argument("dataset_id", help="ID of the BigQuery dataset.")
+    parser.add_argument("--poll_timeout", type=int, default=POLL_TIMEOUT,
+                        help=f"Total time to wait for the export operation in seconds (default: {POLL_TIMEOUT}).")
 
     args = parser.parse_args()
 
-    export_dicom_metadata_to_bq(args.dicom_store_path, args.dataset_id)
+    export_dicom_metadata_to_bq(args.dicom_store_path, args.dataset_id, args.poll_timeout)
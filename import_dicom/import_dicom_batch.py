@@ -23,6 +23,10 @@ from googleapiclient import discovery
 from googleapiclient.errors import HttpError
 import time
 
+POLL_INITIAL_DELAY = 1.0     # Initial delay between operation polls (seconds)
+POLL_DELAY_MULTIPLIER = 1.5  # Delay multiplier applied after each poll
+POLL_MAX_DELAY = 30.0        # Maximum delay between operation polls (seconds)
+
 def import_dicom(gcs_folder, dicom_store_path, storage_class="ARCHIVE"):
     """Imports DICOM files from a GCS folder to a DICOM store.
 
@@ -64,8 +68,10 @@ def import_dicom(gcs_folder, dicom_store_path, storage_class="ARCHIVE"):
 
         # Poll for operation completion
         operation_name = response['name']
+        delay = POLL_INITIAL_DELAY
         while True:
-            time.sleep(5)  # Wait for 5 seconds
+            time.sleep(delay)
+            delay = min(delay * POLL_DELAY_MULTIPLIER, POLL_MAX_DELAY)  # Exponential backoff
             operation = healthcare.projects().locations().datasets().operations().get(
                 name=operation_name
             ).execute()
@@ -22,17 +22,28 @@ Required environment variables:
 - DICOM_STORE_PATH: Path to the Healthcare API DICOM store.
 - BIGQUERY_TABLE_ID: BigQuery table ID in 'project.dataset.table' format.
 - STORAGE_CLASS: (Optional) Storage class for imported DICOMs (defaults to ARCHIVE).
+- REPORT_CSV_GCS_URI: (Optional) GCS URI of a single new report to process, instead of
+  listing the whole directory (set by the workflow when triggered by a GCS event).
 """
 
 import os
+import random
 import re
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from google.api_core.exceptions import PreconditionFailed
 from google.cloud import storage
 from unzip_batch import unzip_and_upload
 from import_dicom_batch import import_dicom
 from validate_dicom_batch import validate_dicom_batch
 
+NUM_REPORT_THREADS = 4  # Reports processed in parallel (bounded by Healthcare API import quota)
+LIST_FIELDS = "items(name),nextPageToken"  # Only object names are needed when listing reports
+
+_REPORT_URI_RE = re.compile(r"gs://([^/]+)/(.+)/REPORT/(\d{8})-report\.csv$")
+_REPORT_NAME_RE = re.compile(r"(\d{8})-report\.csv$")
+
 
 def run_batch_for_report(report_csv_gcs_uri: str, dicom_store_path: str, bigquery_table_id: str, storage_class: str) -> bool:
     """Executes the DICOM batch processing and validation pipeline for a single report.
@@ -52,13 +63,13 @@ def run_batch_for_report(report_csv_gcs_uri: str, dicom_store_path: str, bigquer
 
     try:
         # Validate REPORT_CSV_GCS_URI format
-        if not re.match(r"gs://([^/]+)/(.+)/REPORT/\d{8}-report\.csv$", report_csv_gcs_uri):
+        match = _REPORT_URI_RE.match(report_csv_gcs_uri)
+        if not match:
             raise ValueError(
                 "Invalid REPORT_CSV_GCS_URI format. It should be like: gs://bucket/path/REPORT/YYYMMDD-report.csv"
             )
 
         # Extract bucket, path, and date from REPORT_CSV_GCS_URI
-        match = re.match(r"gs://([^/]+)/(.*)/REPORT/(\d{8})-report\.csv$", report_csv_gcs_uri)
         bucket = match.group(1)
         path = match.group(2)
         date_str = match.group(3)
@@ -81,8 +92,7 @@ def run_batch_for_report(report_csv_gcs_uri: str, dicom_store_path: str, bigquer
         time.sleep(30)  # Wait for 30 seconds
 
         validation_attempts = 0
-        max_attempts = 5  # One initial attempt + two retry
-        sleep_time = 0
+        max_attempts = 5  # One initial attempt + four retries
         while validation_attempts < max_attempts:
             print(f"Validating DICOM batch against: {report_csv_gcs_uri} (Attempt {validation_attempts + 1})")
             if validate_dicom_batch(report_csv_gcs_uri, bigquery_table_id):
@@ -91,9 +101,11 @@ def run_batch_for_report(report_csv_gcs_uri: str, dicom_store_path: str, bigquer
             else:
                 validation_attempts += 1
                 if validation_attempts < max_attempts:
-                    sleep_time += 120  # Wait for 2 more minutes before retrying
-                    print(f"DICOM batch validation failed. Retrying in {sleep_time} seconds...")
-                    time.sleep(sleep_time) 
+                    # Exponential backoff with full jitter (capped at 10 minutes)
+                    backoff = min(30 * (2 ** validation_attempts), 600)
+                    sleep_time = random.uniform(0, backoff)
+                    print(f"DICOM batch validation failed. Retrying in {sleep_time:.0f} seconds...")
+                    time.sleep(sleep_time)
                 else:
                     raise ValueError("DICOM batch validation did not pass after retry. Check logs for details.")
 
@@ -111,9 +123,107 @@ def run_batch_for_report(report_csv_gcs_uri: str, dicom_store_path: str, bigquer
         return False
 
 
+def is_report_pending(date_str: str, files: list) -> bool:
+    """Checks whether a report exists and is neither in progress nor processed.
+
+    Args:
+        date_str: The report date (YYYYMMDD).
+        files: File names (without prefix) listed for the report date.
+
+    Returns:
+        bool: True if the report should be processed, False otherwise.
+    """
+
+    # Define file names
+    report_name = f"{date_str}-report.csv"
+    processing_name = f"{date_str}-report-processing.txt"
+    result_name = f"{date_str}-report-hcapi.csv"
+
+    return report_name in files and (
+        processing_name not in files
+        and result_name not in files
+    )
+
+
+def process_report(bucket, prefix: str, date_str: str, dicom_store_path: str,
+                   bigquery_table_id: str, storage_class: str) -> bool:
+    """Claims a single pending report with a processing file and runs the batch pipeline for it.
+
+    Args:
+        bucket: The GCS bucket object containing the reports.
+        prefix: The prefix of the report directory in the bucket.
+        date_str: The report date (YYYYMMDD).
+        dicom_store_path: Path to the Healthcare API DICOM store.
+        bigquery_table_id: BigQuery table ID in 'project.dataset.table' format.
+        storage_class: Storage class for imported DICOMs.
+
+    Returns:
+        bool: True if the report was processed successfully (or skipped because another
+        run claimed or processed it), False otherwise.
+    """
+
+    # Define file names
+    report_name = f"{date_str}-report.csv"
+    processing_name = f"{date_str}-report-processing.txt"
+    result_name = f"{date_str}-report-hcapi.csv"
+
+    print(f"Processing report: {report_name}")
+    processing_file = f"{prefix}/{processing_name}"
+
+    # Create a processing file to mark the report as in progress
+    # (only if it doesn't exist yet, so concurrent monitors can't claim the same report)
+    print(f"Creating processing file: {processing_name}")
+    try:
+        bucket.blob(processing_file).upload_from_string("", if_generation_match=0)
+    except PreconditionFailed:
+        print(f"Skipping report {report_name} (already in progress)")
+        return True
+    except Exception as e:
+        print(f"Error creating processing file: {e}")
+        return False
+
+    # Double-check on GCS that the report wasn't processed since it was listed
+    # (another run may have finished it and deleted its processing file meanwhile)
+    try:
+        already_processed = bucket.blob(f"{prefix}/{result_name}").exists()
+        if already_processed:
+            print(f"Skipping report {report_name} (already processed)")
+    except Exception as e:
+        print(f"Error checking result file: {e}")
+        already_processed = None
+    if already_processed is not False:
+        # Release the claim so the report isn't left marked as in progress
+        try:
+            bucket.blob(processing_file).delete()
+        except Exception as e:
+            print(f"Error deleting processing file: {e}")
+        return already_processed is True
+
+    # Invoke run_batch_for_report with the necessary parameters
+    report_gcs_uri = f"gs://{bucket.name}/{prefix}/{report_name}"
+    if not run_batch_for_report(report_gcs_uri, dicom_store_path, bigquery_table_id, storage_class):
+        print(f"Error processing report: {report_name}")
+        return False
+
+    print(f"Successfully processed report: {report_name}")
+
+    # Delete the processing file
+    print(f"Deleting processing file: {processing_name}")
+    try:
+        bucket.blob(processing_file).delete()
+    except Exception as e:
+        print(f"Error deleting processing file: {e}")
+        # Report was processed even if deletion fails
+
+    return True
+
+
 def monitor_report() -> bool:
     """Monitors the report directory and triggers processing for new reports.
 
+    If REPORT_CSV_GCS_URI is set (e.g. by an object finalize event), only that
+    report is processed and the report directory is not listed.
+
     Returns:
         bool: True if the monitoring process completed without errors, False otherwise.
     """
@@ -129,6 +239,9 @@ def monitor_report() -> bool:
         # Read optional STORAGE_CLASS, defaulting to ARCHIVE
         storage_class = os.getenv("STORAGE_CLASS", "ARCHIVE")
 
+        # Read optional REPORT_CSV_GCS_URI, set when triggered by a new report
+        report_csv_gcs_uri = os.getenv("REPORT_CSV_GCS_URI", "")
+
         # Remove trailing slash from REPORT_GCS_URI if present
         report_gcs_uri = report_gcs_uri.rstrip("/")
 
@@ -142,6 +255,33 @@ def monitor_report() -> bool:
         except IndexError:
             print(f"Error: Invalid REPORT_GCS_URI format: {report_gcs_uri}")
             return False
+        bucket = storage_client.bucket(bucket_name)
+
+        # Process only the triggering report, if any
+        if report_csv_gcs_uri:
+            report_dir, _, report_name = report_csv_gcs_uri.rpartition("/")
+            match = _REPORT_NAME_RE.match(report_name)
+            if report_dir != report_gcs_uri or not match:
+                print(f"Ignoring object (not a report in {report_gcs_uri}): {report_csv_gcs_uri}")
+                return True
+            date_str = match.group(1)
+
+            # List only the files of this report date (single request) to check its state
+            try:
+                blobs = storage_client.list_blobs(bucket_name, prefix=f"{prefix}/{date_str}-report",
+                                                   fields=LIST_FIELDS)
+                files = [blob.name.split("/")[-1] for blob in blobs]
+            except Exception as e:
+                print(f"Error listing files in GCS: {e}")
+                return False
+
+            success = True
+            if is_report_pending(date_str, files):
+                success = process_report(bucket, prefix, date_str, dicom_store_path, bigquery_table_id, storage_class)
+            else:
+                print(f"Skipping report {report_name} (already processed or in progress)")
+            print("Finished DICOM report monitoring!")
+            return success
 
         # Create a dictionary to cache blob file names
         blob_cache = {}
@@ -149,7 +289,7 @@ def monitor_report() -> bool:
         # List all files in the report directory and populate the cache
         print(f"Listing files in: {report_gcs_uri}")
         try:
-            blobs = storage_client.list_blobs(bucket_name, prefix=prefix)
+            blobs = storage_client.list_blobs(bucket_name, prefix=prefix, fields=LIST_FIELDS)
             for blob in blobs:
                 file_name = blob.name.split("/")[-1]
                 date_str = file_name.split("-")[0]
@@ -160,57 +300,24 @@ def monitor_report() -> bool:
             print(f"Error listing files in GCS: {e}")
             return False
 
-        # Iterate through the cache to process reports
-        for date_str, files in blob_cache.items():
-            # Define file names
-            report_name = f"{date_str}-report.csv"
-            processing_name = f"{date_str}-report-processing.txt"
-            result_name = f"{date_str}-report-hcapi.csv"
-
-            if report_name in files and (
-                processing_name not in files
-                and result_name not in files
-            ):
-                print(f"Processing report: {report_name}")
-
-                # Double-check on GCS if not found in the cache (concurrent processing safe)
-                processing_file = f"{prefix}/{processing_name}"
-                result_file = f"{prefix}/{result_name}"
-                try:
-                    if (storage_client.bucket(bucket_name).blob(processing_file).exists() or 
-                        storage_client.bucket(bucket_name).blob(result_file).exists()
-                    ):
-                        print(f"Skipping report {report_name} (already processed or in progress)")
-                        continue
-                except Exception as e:
-                    print(f"Error checking for existing files on GCS: {e}")
-                    continue
-
-                # Create a processing file to mark the report as in progress
-                print(f"Creating processing file: {processing_name}")
-                try:
-                    storage_client.bucket(bucket_name).blob(processing_file).upload_from_string("")
-                except Exception as e:
-                    print(f"Error creating processing file: {e}")
-                    continue  # Skip to the next report
-
-                # Invoke run_batch_for_report with the necessary parameters
-                report_gcs_uri = f"gs://{bucket_name}/{prefix}/{report_name}"
-                if not run_batch_for_report(report_gcs_uri, dicom_store_path, bigquery_table_id, storage_class):
-                    print(f"Error processing report: {report_name}")
-                    continue
-
-                print(f"Successfully processed report: {report_name}")
-
-                # Delete the processing file
-                print(f"Deleting processing file: {processing_name}")
-                try:
-                    storage_client.bucket(bucket_name).blob(processing_file).delete()
-                except Exception as e:
-                    print(f"Error deleting processing file: {e}")
-                    # Continue to the next report even if deletion fails
+        # Process pending reports from the cache in parallel
+        pending_dates = [date_str for date_str, files in blob_cache.items() if is_report_pending(date_str, files)]
+        with ThreadPoolExecutor(max_workers=NUM_REPORT_THREADS) as executor:
+            futures = [
+                executor.submit(process_report, bucket, prefix, date_str,
+                                dicom_store_path, bigquery_table_id, storage_class)
+                for date_str in pending_dates
+            ]
+            error_count = 0
+            for future in as_completed(futures):
+                if not future.result():
+                    error_count += 1
 
         print("Finished DICOM report monitoring!")
+        if error_count > 0:
+            print(f"Encountered {error_count} errors while processing reports.")
+            return False
+
         return True  # Monitoring completed without errors
 
     except KeyError as e:
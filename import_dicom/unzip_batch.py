@@ -17,15 +17,62 @@ It supports parallel unzipping for faster processing of large batches.
 """
 
 from google.cloud import storage
+from google.cloud.storage import transfer_manager
+import functools
 import zipfile
-from io import BytesIO
 import os.path
-from concurrent.futures import ThreadPoolExecutor
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 import random
+import threading
+
+import google.auth
+from google.auth.transport.requests import AuthorizedSession
+from requests.adapters import HTTPAdapter
 
 INCLUDE_ZIP_NAME = True  # Add the file name (without .zip) as a folder to the unzipped files
-NUM_THREADS = 10         # Define the number of threads
+NUM_THREADS = min(16, (os.cpu_count() or 1) * 4)  # Zip files unzipped at once per process (I/O bound)
+MEMBER_UPLOAD_THREADS = 8  # Number of threads uploading extracted files of each zip
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # Resumable upload chunk size for extracted files
+SLICED_DOWNLOAD_THRESHOLD = 256 * 1024 * 1024  # Zip files larger than this are downloaded in slices
+SLICED_DOWNLOAD_CHUNK_SIZE = 32 * 1024 * 1024  # Size of each slice
+SLICED_DOWNLOAD_THREADS = 8                    # Number of slices downloaded in parallel
+PROGRESS_INTERVAL = 100  # Report progress every N processed zip files
+LIST_FIELDS = "items(name,size,generation,crc32c),nextPageToken"  # Metadata needed to download (and verify) the zip files
+# HTTP connections kept by the shared GCS client (one per concurrent request of all zip workers)
+HTTP_POOL_SIZE = NUM_THREADS * max(MEMBER_UPLOAD_THREADS, SLICED_DOWNLOAD_THREADS)
+
+# Limits zip workers across all concurrent unzip_and_upload calls (e.g. parallel reports),
+# so they never need more connections than the shared client's pool
+_unzip_slots = threading.BoundedSemaphore(NUM_THREADS)
+
+
+@functools.lru_cache(maxsize=1)
+def _storage_client():
+    """Returns the shared GCS client, with a connection pool sized for all zip workers."""
+    # The default requests session keeps only 10 connections. Passing our own session relies
+    # on the client's _http argument (google-cloud-storage internals, may change on upgrade).
+    credentials, project = google.auth.default(scopes=storage.Client.SCOPE)
+    session = AuthorizedSession(credentials)
+    session.mount("https://", HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE))
+    return storage.Client(project=project, credentials=credentials, _http=session)
+
+
+def upload_zip_member(zip_file, file_info, extracted_blob):
+    """Streams a single file from an open zip file to a GCS blob.
+
+    Args:
+        zip_file: The open ZipFile object.
+        file_info: The ZipInfo of the file to extract.
+        extracted_blob: The GCS blob object to upload the file to.
+    """
+    # Safe to call from several threads on the same ZipFile (read mode, seekable file):
+    # each opened member keeps its own file position and seeks/reads the underlying
+    # file under the ZipFile's lock
+    with zip_file.open(file_info) as src:
+        extracted_blob.upload_from_file(src, size=file_info.file_size, rewind=False)
+
 
 def unzip_and_upload_single(blob, bucket, debug_logs=False, retries=3, backoff_factor=2):
     """Unzips a single zip file, uploads contents, and deletes the original.
@@ -46,27 +93,49 @@ def unzip_and_upload_single(blob, bucket, debug_logs=False, retries=3, backoff_f
             if debug_logs:
                 print(f"Unzipping: {file_name_uri}")
             file_name = blob.name
-            zip_bytes = blob.download_as_bytes()
-
-            # Extract the zip file in memory
-            with zipfile.ZipFile(BytesIO(zip_bytes)) as zip_file:
-                for file_info in zip_file.infolist():
-                    if not file_info.is_dir():
-                        # Get the file name and contents
-                        if INCLUDE_ZIP_NAME:
-                            # Use file_name (without .zip) as path
-                            extracted_file_name = f"{file_name[:-4]}/{file_info.filename}"
-                        else:
-                            # Use only dirname from file_name as path
-                            extracted_file_name = f"{os.path.dirname(file_name)}/{file_info.filename}"
-                        extracted_file_content = zip_file.read(file_info)
-
-                        # Upload the extracted file back to GCS
-                        extracted_blob = bucket.blob(extracted_file_name)
-                        extracted_blob.upload_from_string(extracted_file_content)
-
-            # Delete the original .zip file
-            blob.delete()
+            if INCLUDE_ZIP_NAME:
+                # Use file_name (without .zip) as path
+                extracted_prefix = file_name[:-4]
+            else:
+                # Use only dirname from file_name as path
+                extracted_prefix = os.path.dirname(file_name)
+
+            # Wait for a free zip worker slot (shared by all concurrent calls)
+            with _unzip_slots:
+                # Download the zip file to a temporary file (not held in memory)
+                with tempfile.NamedTemporaryFile() as zip_tmp:
+                    if blob.size is not None and blob.size > SLICED_DOWNLOAD_THRESHOLD:
+                        # Download large zip files in parallel slices
+                        transfer_manager.download_chunks_concurrently(
+                            blob, zip_tmp.name, chunk_size=SLICED_DOWNLOAD_CHUNK_SIZE,
+                            max_workers=SLICED_DOWNLOAD_THREADS, worker_type=transfer_manager.THREAD
+                        )
+                        # Make sure all slices were written before unzipping
+                        downloaded_size = os.path.getsize(zip_tmp.name)
+                        if downloaded_size != blob.size:
+                            raise IOError(f"Incomplete download: {downloaded_size} of {blob.size} bytes")
+                    else:
+                        blob.download_to_file(zip_tmp)
+                    zip_tmp.seek(0)
+
+                    # Stream the extracted files back to GCS in parallel
+                    with zipfile.ZipFile(zip_tmp) as zip_file, \
+                            ThreadPoolExecutor(max_workers=MEMBER_UPLOAD_THREADS) as upload_executor:
+                        upload_futures = []
+                        for file_info in zip_file.infolist():
+                            if not file_info.is_dir():
+                                extracted_file_name = f"{extracted_prefix}/{file_info.filename}"
+                                extracted_blob = bucket.blob(extracted_file_name, chunk_size=UPLOAD_CHUNK_SIZE)
+                                upload_futures.append(
+                                    upload_executor.submit(upload_zip_member, zip_file, file_info, extracted_blob)
+                                )
+
+                        # Wait for the uploads and raise the first error, if any
+                        for future in upload_futures:
+                            future.result()
+
+                # Delete the original .zip file
+                blob.delete()
             if debug_logs:
                 end_time = time.time()  # Stop the timer
                 elapsed_time = round(end_time - start_time, 2)  # Calculate elapsed time in seconds
@@ -100,13 +169,14 @@ def unzip_and_upload(bucket_name, prefix, debug_logs=False):
     """
     try:
         start_time = time.time()  # Start the timer
-        storage_client = storage.Client()
+        storage_client = _storage_client()
         bucket = storage_client.bucket(bucket_name)
 
         if debug_logs:
             print(f"Seeking zip files...")
-        blobs = storage_client.list_blobs(bucket_name, prefix=prefix)
-        zip_blobs = [blob for blob in blobs if blob.name.endswith(".zip")]
+        # Let GCS filter the zip files (the prefix may already contain many extracted files)
+        blobs = storage_client.list_blobs(bucket_name, prefix=prefix, match_glob="**.zip", fields=LIST_FIELDS)
+        zip_blobs = list(blobs)
         print(f"Found {len(zip_blobs)} zip files.")
 
         if not zip_blobs:
@@ -114,15 +184,28 @@ def unzip_and_upload(bucket_name, prefix, debug_logs=False):
 
         with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
             # Submit each zip file to the thread pool
-            results = list(executor.map(unzip_and_upload_single, zip_blobs, [bucket]*len(zip_blobs), [debug_logs]*len(zip_blobs)))
+            unzip_fn = functools.partial(unzip_and_upload_single, bucket=bucket, debug_logs=debug_logs)
+            futures = {executor.submit(unzip_fn, zip_blob): zip_blob for zip_blob in zip_blobs}
+
+            # Count results as they complete, reporting failures right away
+            success_count = 0
+            error_count = 0
+            for completed, future in enumerate(as_completed(futures), start=1):
+                zip_blob = futures.pop(future)  # Release the completed future
+                if future.result():
+                    success_count += 1
+                else:
+                    error_count += 1
+                    print(f"Failed to unzip and upload: gs://{bucket_name}/{zip_blob.name}")
+                if completed % PROGRESS_INTERVAL == 0:
+                    print(f"Progress: {completed}/{len(zip_blobs)} zip files processed ({error_count} errors)")
 
         # Report elapsed time
         end_time = time.time()  # Stop the timer
         elapsed_time = round(end_time - start_time, 2)  # Calculate elapsed time in seconds
-        print(f"Processed {results.count(True)} zip files in {elapsed_time} seconds")
+        print(f"Processed {success_count} zip files in {elapsed_time} seconds")
 
-        # Count the number of False results (errors)
-        error_count = results.count(False)
+        # Report the number of errors
         if error_count > 0:
             print(f"Encountered {error_count} errors during unzip and upload process.")
             return False
@@ -12,9 +12,9 @@
 
 """Validates DICOM reports against a BigQuery summary table.
 
-This script retrieves all '-report.csv' files from a GCS URI,
+This script reads all '-report.csv' files from a GCS URI as a BigQuery external table,
 queries a BigQuery summary table for matching StudyDates and StudyInstanceUIDs,
-and compares object counts to validate report consistency.
+and compares object counts to validate report consistency (in a single query).
 
 Usage: python validate_dicom_reports.py <REPORT_GCS_URI> <HCAPI_BIGQUERY_TABLE_ID> <LEGACY_BIGQUERY_TABLE_ID> [--cleanup]
 
@@ -23,10 +23,64 @@ python validate_dicom_reports.py gs://your-bucket/reports your_project.your_data
 """
 
 import argparse
+import functools
 import re
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import bigquery
+from google.api_core.exceptions import NotFound
 from google.cloud import storage
-import pandas as pd
+
+DELETE_BATCH_SIZE = 100  # Maximum number of calls in a GCS batch request
+LIST_THREADS = 16        # Number of sub-folders listed in parallel
+
+_GCS_URI_RE = re.compile(r"gs://([^/]+)/(.*)")
+
+# Report CSV columns (explicit, so a single report can't change the types of all reports)
+REPORT_SCHEMA = [
+    bigquery.SchemaField("studyinstanceuid", "STRING"),
+    bigquery.SchemaField("accessionnumber", "STRING"),
+    bigquery.SchemaField("patientid", "STRING"),
+    bigquery.SchemaField("objectcount", "INT64"),
+    bigquery.SchemaField("stddate", "STRING"),
+]
+
+
+@functools.lru_cache(maxsize=1)
+def _storage_client():
+    """Shared GCS client for listing and deletes."""
+    return storage.Client()
+
+
+@functools.lru_cache(maxsize=1)
+def _bq_client():
+    """Shared BigQuery client for the validation query."""
+    return bigquery.Client()
+
+def list_blobs_parallel(bucket, prefix):
+    """Lists all blobs under a prefix, listing its sub-folders in parallel.
+
+    Sub-folders are found with a delimited listing. While the prefix holds a single
+    sub-folder (e.g. "path/DICOM/20231225" -> "path/DICOM/20231225/"), the next level is used.
+
+    Args:
+        bucket: The GCS bucket object.
+        prefix: The prefix of the blobs to list.
+
+    Returns:
+        list: The blobs under the prefix.
+    """
+    blobs = []
+    prefixes = [prefix]
+    while len(prefixes) == 1:
+        iterator = bucket.list_blobs(prefix=prefixes[0], delimiter="/")
+        blobs.extend(iterator)
+        prefixes = sorted(iterator.prefixes)
+
+    with ThreadPoolExecutor(max_workers=LIST_THREADS) as executor:
+        for sub_blobs in executor.map(lambda sub_prefix: list(bucket.list_blobs(prefix=sub_prefix)), prefixes):
+            blobs.extend(sub_blobs)
+
+    return blobs
 
 def cleanup_gcs_objects(bucket_name, dicom_prefix):
     """Cleans up GCS objects related to a DICOM date.
@@ -36,14 +90,18 @@ def cleanup_gcs_objects(bucket_name, dicom_prefix):
         dicom_prefix: The prefix of the report in GCS (e.g., "path/to/DICOM/20231225").
     """
     try:
-        storage_client = storage.Client()
+        storage_client = _storage_client()
         bucket = storage_client.bucket(bucket_name)
 
         print(f"  - Cleaning up GCS objects with prefix: {dicom_prefix}")
-        blobs = bucket.list_blobs(prefix=dicom_prefix)
-        for blob in blobs:
-            # print(f"    - Deleting: {blob.name}")
-            blob.delete()
+        blobs = list_blobs_parallel(bucket, dicom_prefix)
+
+        # Delete in batches (one HTTP request per batch instead of per object)
+        for i in range(0, len(blobs), DELETE_BATCH_SIZE):
+            with storage_client.batch():
+                for blob in blobs[i:i + DELETE_BATCH_SIZE]:
+                    blob.delete()
+        print(f"  - Deleted {len(blobs)} GCS objects")
 
     except Exception as e:
         print(f"  - Error cleaning up GCS objects: {e}")
@@ -60,69 +118,112 @@ def validate_dicom_reports(report_gcs_uri, hcapi_bigquery_table_id, legacy_bigqu
 
     try:
         # Create GCS and BigQuery clients
-        storage_client = storage.Client()
-        bq_client = bigquery.Client()
+        storage_client = _storage_client()
+        bq_client = _bq_client()
 
         # Extract bucket name and prefix from GCS URI
-        match = re.match(r"gs://([^/]+)/(.*)", report_gcs_uri)
+        match = _GCS_URI_RE.match(report_gcs_uri)
         if not match:
             raise ValueError(f"Invalid REPORT_GCS_URI format: {report_gcs_uri}")
         bucket_name = match.group(1)
-        prefix = match.group(2)
+        prefix = match.group(2).rstrip("/")
+        report_dir = f"{prefix}/" if prefix else ""
 
-        # Get all report file names from GCS
         bucket = storage_client.bucket(bucket_name)
-        blobs = bucket.list_blobs(prefix=prefix)
-        report_files = [blob.name for blob in blobs if blob.name.endswith('-report.csv')]
 
-        # Query BigQuery for StudyDates and object counts (grouped by StudyDate)
+        # Get all report file names from GCS (including reports without any rows)
+        blobs = storage_client.list_blobs(bucket_name, prefix=report_dir, match_glob="**-report.csv",
+                                          fields="items(name),nextPageToken")
+        report_uris = [f"gs://{bucket_name}/{blob.name}" for blob in blobs]
+        if not report_uris:
+            print(f"No report files found in {report_gcs_uri}")
+            return True
+
+        # Read all report CSVs through a temporary external table (no per-file downloads)
+        external_config = bigquery.ExternalConfig("CSV")
+        external_config.source_uris = [f"gs://{bucket_name}/{report_dir}*-report.csv"]
+        external_config.schema = REPORT_SCHEMA
+        external_config.options.skip_leading_rows = 1
+        job_config = bigquery.QueryJobConfig(
+            table_definitions={"reports": external_config},
+            query_parameters=[bigquery.ArrayQueryParameter("report_files", "STRING", report_uris)],
+        )
+
+        # Query BigQuery for report object counts (per report file) and StudyDate object counts
         query = f"""
+        WITH report_files AS (
+            SELECT ReportFile
+            FROM UNNEST(@report_files) AS ReportFile
+        ),
+        report_rows AS (
+            SELECT _FILE_NAME AS ReportFile, objectcount
+            FROM reports
+        ),
+        report_counts AS (
+            SELECT
+                f.ReportFile,
+                REGEXP_EXTRACT(f.ReportFile, r'(\\d{{8}})-report\\.csv$') AS StudyDate,
+                COALESCE(SUM(r.objectcount), 0) AS ReportObjectCount
+            FROM report_files AS f
+            LEFT JOIN report_rows AS r
+            ON r.ReportFile = f.ReportFile
+            GROUP BY 1, 2
+        ),
+        report_dates AS (
+            -- Only aggregate the StudyDates that have a report
+            SELECT DISTINCT SAFE.PARSE_DATE('%Y%m%d', StudyDate) AS StudyDate
+            FROM report_counts
+        ),
+        bq_counts AS (
+            SELECT
+                FORMAT_DATE('%Y%m%d', legacy.StudyDate) AS StudyDate,
+                SUM(legacy.ObjectCount) AS LegacyObjectCount,
+                SUM(hcapi.ObjectCount) AS HcapiObjectCount
+            FROM
+                (SELECT StudyDate, StudyInstanceUID, SUM(ObjectCount) AS ObjectCount 
+                 FROM `{legacy_bigquery_table_id}` 
+                 WHERE StudyDate IN (SELECT StudyDate FROM report_dates)
+                 GROUP BY StudyDate, StudyInstanceUID) AS legacy
+                JOIN (SELECT StudyDate, StudyInstanceUID, SUM(ObjectCount) AS ObjectCount 
+                      FROM `{hcapi_bigquery_table_id}` 
+                      WHERE StudyDate IN (SELECT StudyDate FROM report_dates)
+                      GROUP BY StudyDate, StudyInstanceUID) AS hcapi
+            ON
+            legacy.StudyDate = hcapi.StudyDate
+            AND legacy.StudyInstanceUID = hcapi.StudyInstanceUID
+            GROUP BY
+                1
+        )
         SELECT
-            FORMAT_DATE('%Y%m%d', legacy.StudyDate) AS StudyDate,
-            SUM(legacy.ObjectCount) AS LegacyObjectCount,
-            SUM(hcapi.ObjectCount) AS HcapiObjectCount
-        FROM
-            (SELECT StudyDate, StudyInstanceUID, SUM(ObjectCount) AS ObjectCount 
-             FROM `{legacy_bigquery_table_id}` 
-             GROUP BY StudyDate, StudyInstanceUID) AS legacy
-            JOIN (SELECT StudyDate, StudyInstanceUID, SUM(ObjectCount) AS ObjectCount 
-                  FROM `{hcapi_bigquery_table_id}` 
-                  GROUP BY StudyDate, StudyInstanceUID) AS hcapi
-        ON
-        legacy.StudyDate = hcapi.StudyDate
-        AND legacy.StudyInstanceUID = hcapi.StudyInstanceUID
-        GROUP BY
-            1
+            r.ReportFile,
+            r.StudyDate,
+            r.ReportObjectCount,
+            b.StudyDate IS NOT NULL AS InBigQuery,
+            b.LegacyObjectCount,
+            b.HcapiObjectCount
+        FROM report_counts AS r
+        LEFT JOIN bq_counts AS b
+        ON r.StudyDate = b.StudyDate
+        ORDER BY
+            r.ReportFile
         """
-        query_job = bq_client.query(query)
-        bq_results = query_job.result()
-
-        # Create a dictionary to store BigQuery results for faster lookup
-        bq_data = {row.StudyDate: (row.LegacyObjectCount, row.HcapiObjectCount) 
-                   for row in bq_results}
+        try:
+            bq_results = bq_client.query(query, job_config=job_config).result()
+        except NotFound as e:
+            print(f"No report files found in {report_gcs_uri}: {e}")
+            return True
 
         # Iterate through report files and validate
-        for report_file in report_files:
-            report_date = re.search(r"(\d{8})-report\.csv$", report_file)
+        for row in bq_results:
+            report_file = row.ReportFile.replace(f"gs://{bucket_name}/", "", 1)
+            report_date = row.StudyDate
             if report_date:
-                report_date = report_date.group(1)
                 print(f"Validating report: {report_file} (StudyDate: {report_date})")
-
-                # Read object count from the report CSV
-                try:
-                    report_blob = bucket.blob(report_file)
-                    report_df = pd.read_csv(report_blob.open("r"))
-                    report_object_count = report_df['objectcount'].sum()
-                except KeyError as e:
-                    print(f"  - Error reading report: {report_file}. Missing column: {e}")
-                    continue  # Skip to the next report
-                except Exception as e:
-                    print(f"  - Error reading report: {report_file}. Error: {e}")
-                    continue  # Skip to the next report
+                report_object_count = row.ReportObjectCount
 
                 # Check if report date exists in BigQuery data
-                if report_date in bq_data:
-                    bq_legacy_count, bq_hcapi_count = bq_data[report_date]
+                if row.InBigQuery:
+                    bq_legacy_count, bq_hcapi_count = row.LegacyObjectCount, row.HcapiObjectCount
                     if report_object_count == bq_legacy_count and report_object_count == bq_hcapi_count:
                         print(f"  - Report validated OK. Object count matches: {report_object_count}")
 
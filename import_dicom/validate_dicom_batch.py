@@ -24,14 +24,49 @@ python validate_dicom_batch.py gs://your-bucket/path/20231220-report.csv your_pr
 """
 
 import argparse
-from datetime import datetime
-from io import StringIO
+import functools
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 from google.cloud import bigquery
 from google.cloud import storage
 from google.api_core.exceptions import NotFound
 
+_GCS_RE = re.compile(r"^gs://([^/]+)/(.*)$")
+
+REPORT_COLUMNS = ["studyinstanceuid", "accessionnumber", "patientid", "objectcount", "stddate"]
+
+# Report column dtypes (Arrow-backed strings, so IDs keep leading zeros)
+_CSV_DTYPES = {
+    "studyinstanceuid": "string[pyarrow]",
+    "accessionnumber": "string[pyarrow]",
+    "patientid": "string[pyarrow]",
+    "objectcount": "int32",  # Object count of a single study
+    "stddate": "string[pyarrow]",
+}
+
+
+@functools.lru_cache(maxsize=1)
+def _storage_client():
+    """GCS client shared by the report upload and reads."""
+    return storage.Client()
+
+
+@functools.lru_cache(maxsize=1)
+def _bq_client():
+    """BigQuery client for the report query."""
+    return bigquery.Client()
+
+
+def _split_gcs_uri(gcs_uri: str) -> tuple:
+    """Splits a GCS URI into its bucket name and blob name."""
+    match = _GCS_RE.match(gcs_uri)
+    if not match:
+        raise ValueError(f"Invalid GCS URI: {gcs_uri}")
+    return match.group(1), match.group(2)
+
 
 def export_dicom_metadata_to_csv(
     date_str: str, bigquery_table_id: str, gcs_uri_csv: str
@@ -51,7 +86,7 @@ def export_dicom_metadata_to_csv(
     print(f"Generating report from BigQuery for StudyDate: {date_str}...")
     try:
         # Construct BigQuery client and query (make sure query ignores deleted instances from streaming table)
-        bq_client = bigquery.Client()
+        bq_client = _bq_client()
         query = f"""
             SELECT
                 StudyDate,
@@ -70,7 +105,7 @@ def export_dicom_metadata_to_csv(
                 FROM
                     `{bigquery_table_id}`
                 WHERE
-                    StudyDate = '{date_str}') AS r
+                    StudyDate = @study_date) AS r
             WHERE
                 r._row_id=1
                 AND r.Type<>'DELETE'
@@ -84,25 +119,31 @@ def export_dicom_metadata_to_csv(
                 StudyInstanceUID
         """
         
-        # Execute the query
-        query_job = bq_client.query(query)
-        results = query_job.result()
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ScalarQueryParameter("study_date", "DATE", date_str)],
+            use_query_cache=True,
+        )
 
-        # Write results to a CSV string
-        csv_data = "studyinstanceuid,accessionnumber,patientid,objectcount,stddate\n"
-        for row in results:
-            csv_data += f"{row.StudyInstanceUID},{row.AccessionNumber if row.AccessionNumber else ''},{row.PatientID if row.PatientID else ''},{row.ObjectCount},{row.StudyDate}\n"
+        # Execute the query (large results are read with the BigQuery Storage API)
+        df = bq_client.query_and_wait(query, job_config=job_config).to_dataframe(create_bqstorage_client=True)
+        df["AccessionNumber"] = df["AccessionNumber"].fillna("")
+        df["PatientID"] = df["PatientID"].fillna("")
 
         # Determine bucket_name and blob_name
-        parts = gcs_uri_csv.replace("gs://", "").split("/", 1)
-        bucket_name = parts[0]
-        blob_name = parts[1] if len(parts) > 1 else ""
+        bucket_name, blob_name = _split_gcs_uri(gcs_uri_csv)
 
-        # Upload CSV data to GCS
-        storage_client = storage.Client()
+        # Write results to a temporary CSV file and upload it to GCS (no full CSV string in memory)
+        storage_client = _storage_client()
         bucket = storage_client.bucket(bucket_name)
         blob = bucket.blob(blob_name)
-        blob.upload_from_string(csv_data)
+        with tempfile.TemporaryFile() as csv_file:
+            df.to_csv(
+                csv_file,
+                index=False,
+                columns=["StudyInstanceUID", "AccessionNumber", "PatientID", "ObjectCount", "StudyDate"],
+                header=REPORT_COLUMNS,
+            )
+            blob.upload_from_file(csv_file, content_type="text/csv", rewind=True)
 
         print(f"CSV file uploaded to gs://{bucket_name}/{blob_name}")
         return True
@@ -112,42 +153,36 @@ def export_dicom_metadata_to_csv(
         return False
 
 
-def download_csv_from_bucket(gcs_uri_csv: str) -> str:
+def read_csv_from_bucket(gcs_uri_csv: str):
     """
-    Downloads a CSV file from a bucket, and returns the CSV as a string.
+    Reads a CSV file from a bucket into a DataFrame.
 
     Args:
-        gcs_uri_csv: CSV file name in bucket to download (URI).
+        gcs_uri_csv: CSV file name in bucket to read (URI).
 
     Returns:
-        str: The CSV content as a string, or an empty string if an error occurs.
+        pd.DataFrame: The CSV content as a DataFrame, or None if an error occurs.
     """
-    print(f"Downloading CSV file from: {gcs_uri_csv}")
+    print(f"Reading CSV file from: {gcs_uri_csv}")
     try:
         # Determine bucket_name and blob_name
-        parts = gcs_uri_csv.replace("gs://", "").split("/", 1)
-        bucket_name = parts[0]
-        blob_name = parts[1] if len(parts) > 1 else ""
+        bucket_name, blob_name = _split_gcs_uri(gcs_uri_csv)
 
-        # Download CSV
-        storage_client = storage.Client()
+        # Parse the CSV straight from the GCS byte stream (no intermediate string)
+        storage_client = _storage_client()
         bucket = storage_client.bucket(bucket_name)
         blob = bucket.blob(blob_name)
+        with blob.open("rb") as csv_file:
+            df = pd.read_csv(csv_file, engine="c", dtype=_CSV_DTYPES)
 
-        # Check if the blob exists
-        if not blob.exists():
-            raise NotFound(f"CSV file not found: {gcs_uri_csv}")
-
-        csv_str = blob.download_as_text()
+        return df
 
-        return csv_str
-
-    except NotFound as e:
-        print(f"Error: {e}")
-        return ""
+    except NotFound:
+        print(f"Error: CSV file not found: {gcs_uri_csv}")
+        return None
     except Exception as e:
-        print(f"Error downloading CSV from bucket: {e}")
-        return ""
+        print(f"Error reading CSV from bucket: {e}")
+        return None
 
 
 def compare_csv_reports(gcs_uri_csv1: str, gcs_uri_csv2: str) -> bool:
@@ -165,33 +200,30 @@ def compare_csv_reports(gcs_uri_csv1: str, gcs_uri_csv2: str) -> bool:
 
     print(f"Comparing CSV reports...")
     try:
-        # Download CSVs from GCS
-        csv1_str = download_csv_from_bucket(gcs_uri_csv1)
-        csv2_str = download_csv_from_bucket(gcs_uri_csv2)
-
-        # If either download failed, return False
-        if not csv1_str or not csv2_str:
+        # Read CSVs from GCS into DataFrames in parallel (same dtypes, so merge keys match on both sides)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            future1 = executor.submit(read_csv_from_bucket, gcs_uri_csv1)
+            future2 = executor.submit(read_csv_from_bucket, gcs_uri_csv2)
+            df1, df2 = future1.result(), future2.result()
+
+        # If either read failed, return False
+        if df1 is None or df2 is None:
             return False
 
-        # Read CSVs into DataFrames
-        df1 = pd.read_csv(StringIO(csv1_str))
-        df2 = pd.read_csv(StringIO(csv2_str))
-
-        # Add a 'Source' column to identify the origin of each row
-        df1["Source"] = gcs_uri_csv1
-        df2["Source"] = gcs_uri_csv2
-
-        # Find differences based on all columns except 'Source'
+        # Find differences based on all report columns (single hash join)
         print(f"Finding differences in reports...")
-        diff = pd.concat([df1, df2]).drop_duplicates(
-            subset=df1.columns.difference(["Source"]), keep=False
-        )
+        diff = df1.merge(df2, on=REPORT_COLUMNS, how="outer", indicator=True)
+        diff = diff[diff["_merge"] != "both"]
 
         if diff.empty:
             print("The CSV reports are identical.")
             return True
         else:
             print("Differences found in the CSV reports:")
+            # Add a 'Source' column to identify the origin of each row
+            diff = diff.assign(
+                Source=diff["_merge"].map({"left_only": gcs_uri_csv1, "right_only": gcs_uri_csv2}).astype(str)
+            ).drop(columns="_merge")
             # Sort the differences by StudyInstanceUID and Source
             print(diff.sort_values(by=['studyinstanceuid', 'Source']).to_string())
             return False
@@ -214,10 +246,10 @@ def validate_dicom_batch(gcs_uri_csv: str, bigquery_table_id: str):
         return False
 
     # Extract date from GCS URI
-    try:
-        date_str = gcs_uri_csv.split("/")[-1].split("-")[0]
-        date_str = datetime.strptime(date_str, "%Y%m%d").strftime("%Y-%m-%d")
-    except (ValueError, IndexError):
+    date_str = gcs_uri_csv.split("/")[-1].split("-")[0]
+    if len(date_str) == 8 and date_str.isdigit():
+        date_str = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]}"
+    else:
         print("Incorrect GCS URI format. It should be like: gs://your-bucket/path/YYYYMMDD-report.csv")
         return False
 
@@ -13,6 +13,7 @@ import os
 import sys
 from dotenv import load_dotenv
 from google.cloud import bigquery
+from google.cloud import bigquery_storage
 from google.cloud import pubsub_v1
 
 # Load environment variables from .env file
@@ -32,24 +33,44 @@ def publish_study_pubsub(study_instance_uid):
 
     # Clients
     client = bigquery.Client(project=project_id)
-    publisher = pubsub_v1.PublisherClient()
+    bqstorage_client = bigquery_storage.BigQueryReadClient()
+    batch_settings = pubsub_v1.types.BatchSettings(
+        max_messages=1000,  # Publish up to 1000 messages per request
+        max_bytes=1024 * 1024,  # 1 MB
+        max_latency=0.05,  # 50 ms
+    )
+    publisher = pubsub_v1.PublisherClient(batch_settings=batch_settings)
     topic_path = publisher.topic_path(project_id, pubsub_topic_id)
 
-    # Query to Fetch Instance Paths
+    # Query to Fetch Instance UIDs (instance paths are built client-side)
     query = f"""
-    SELECT CONCAT('/studies/', StudyInstanceUID, '/series/', SeriesInstanceUID, '/instances/', SOPInstanceUID) instance
+    SELECT StudyInstanceUID, SeriesInstanceUID, SOPInstanceUID
     FROM `{project_id}.{bigquery_dataset}.{bigquery_table}`
-    WHERE StudyInstanceUID = '{study_instance_uid}'
+    WHERE StudyInstanceUID = @study_uid
     """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("study_uid", "STRING", study_instance_uid)],
+        use_query_cache=True,
+    )
 
     # Run BigQuery Query
-    query_job = client.query(query)
+    query_job = client.query(query, job_config=job_config)
 
-    # Process Results and Publish to Pub/Sub 
-    for row in query_job.result():
-        instance_path = row["instance"]
-        # Publish the message (ensuring it's encoded)
-        future = publisher.publish(topic_path, instance_path.encode("utf-8"))
+    # Process Results and Publish to Pub/Sub (batched, without waiting on each message)
+    # Results are read with the BigQuery Storage Read API, in Arrow record batches
+    futures = []
+    for batch in query_job.result().to_arrow_iterable(bqstorage_client=bqstorage_client):
+        for study_uid, series_uid, instance_uid in zip(
+            batch.column("StudyInstanceUID").to_pylist(),
+            batch.column("SeriesInstanceUID").to_pylist(),
+            batch.column("SOPInstanceUID").to_pylist(),
+        ):
+            instance_path = f"/studies/{study_uid}/series/{series_uid}/instances/{instance_uid}"
+            # Publish the message (ensuring it's encoded)
+            futures.append((instance_path, publisher.publish(topic_path, instance_path.encode("utf-8"))))
+
+    # Wait for all messages to be published
+    for instance_path, future in futures:
         print(f"Published instance path: {instance_path} (message ID: {future.result()})")
 
 